@@ -66,6 +66,9 @@ setup_params = dict(
     # entry points don't like python modules containing dashes :-(
     py_modules = [pkgfile],
     python_requires = '>=3',
+    extras_require = {
+        'x11': ['python-xlib'],
+    },
     classifiers = [
         'Development Status :: 4 - Beta',
         'Intended Audience :: System Administrators',
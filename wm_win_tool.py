@@ -66,18 +66,37 @@ __license__ = 'GNU GPL 2 - see https://www.gnu.org/licenses/gpl2.txt for details
 __homepage__ = 'https://github.com/frispete/wm-win-tool'
 
 
+import io
 import os
 import re
 import sys
-import time
+import json
 import getopt
+import shlex
 import locale
+import heapq
+import hashlib
+import itertools
 import fnmatch
 import logging
+import operator
 import logging.handlers
+import tempfile
 import datetime
 import functools
 import subprocess
+import concurrent.futures
+
+# optional: talk to the X server in-process
+try:
+    import Xlib.X
+    import Xlib.Xatom
+    import Xlib.error
+    import Xlib.display
+    import Xlib.protocol.event
+    import Xlib.protocol.request
+except ImportError:
+    Xlib = None
 
 
 class gpar:
@@ -101,6 +120,12 @@ class gpar:
     # internals
     storelistdir = os.path.expanduser('~/.local/share/wm-win-tool')
     timestamp = '%Y-%m-%d_%H-%M-%S'
+    # max. number of concurrent xprop and wmctrl processes
+    maxworkers = 8
+    # collate window titles with locale.strxfrm (slow)
+    locale_sort = False
+    # X11 connection, if python-xlib is available
+    x11 = None
 
 
 log = logging.getLogger(gpar.appname)
@@ -139,6 +164,11 @@ def setup_logging(loglevel):
     logging.basicConfig(**logconfig)
 
 
+# natural sort split pattern
+_SPLIT_RE = re.compile('([0-9]+)')
+
+
+@functools.lru_cache(maxsize = 4096)
 def natural_sort_key(s, case_insensitive = True):
     try:
         for sl in '[]', '()', '{}', '""', "''":
@@ -146,17 +176,13 @@ def natural_sort_key(s, case_insensitive = True):
                 s = s[1:-1]
     except IndexError:
         pass
-    text_case = lambda t: t.lower() if case_insensitive else t
-    return [int(text) if text.isdigit() else locale.strxfrm(text_case(text))
-            for text in re.split('([0-9]+)', s)]
-
-
-def rstrip(line, lst = ' \t\r\n'):
-    '''strip whitespace and line breaks from line end'''
-    items = list(lst)
-    while line and line[-1] in items:
-        line = line[:-1]
-    return line
+    text_key = lambda t: t.casefold() if case_insensitive else t
+    if gpar.locale_sort:
+        text_case = text_key
+        text_key = lambda t: locale.strxfrm(text_case(t))
+    # results are cached and shared, hence return an immutable tuple
+    return tuple(int(text) if text.isdigit() else text_key(text)
+                 for text in _SPLIT_RE.split(s))
 
 
 def unexpanduser(path):
@@ -168,13 +194,19 @@ def unexpanduser(path):
 
 
 def new_timestamp_filename(path, ext):
-    '''return unique filename with timestamp.ext in path'''
-    while True:
-        fn = os.path.join(path,
-             datetime.datetime.now().strftime(gpar.timestamp) + ext)
-        if not os.path.exists(fn):
+    '''return unique filename with timestamp.ext in path,
+       the file is created empty in order to reserve its name
+    '''
+    base = os.path.join(path, datetime.datetime.now().strftime(gpar.timestamp))
+    fn = base + ext
+    for cnt in itertools.count(1):
+        try:
+            os.close(os.open(fn, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666))
+        except FileExistsError:
+            # the suffix sorts after the plain timestamp
+            fn = '%s_%02d%s' % (base, cnt, ext)
+        else:
             return fn
-        time.sleep(1)
 
 
 def fdict(dct):
@@ -182,12 +214,9 @@ def fdict(dct):
        keys, starting with underscore are suppressed
        Note: only string types are allowed as keys
     '''
-    ret = []
-    keys = [key for key in dct.keys() if not key.startswith('_')]
-    maxkeylen = len(keys) and max([len(key) for key in keys]) or 0
-    for key in keys:
-        ret.append('%*s: %r' % (maxkeylen, key, dct[key]))
-    return '\n'.join(ret)
+    keys = [key for key in dct if not key.startswith('_')]
+    maxkeylen = max(map(len, keys), default = 0)
+    return '\n'.join('%*s: %r' % (maxkeylen, key, dct[key]) for key in keys)
 
 
 class WinNotFound(Exception):
@@ -204,51 +233,69 @@ class WinDuplicate(WinNotFound):
     '''
 
 
-# https://docs.python.org/dev/library/functools.html#functools.total_ordering
-@functools.total_ordering
 class Win:
     '''a window, as fetched from wmctrl, with an additional shaded attribute'''
     # active window attributes
     _fields = 'winid, desktop, pid, x, y, w, h, cls, host, title, shaded'.split(', ')
     # default values for _fields
-    _defaults = '0, -1, 0, 0, 0, 0, 0, , , , N'.split(', ')
+    _defaults = tuple('0, -1, 0, 0, 0, 0, 0, , , , N'.split(', '))
     # storage format is a subset of active fields
     _storefields = 'desktop, shaded, x, y, w, h, cls, title'.split(', ')
+    # no per instance dict, cached values are kept in slots as well
+    __slots__ = tuple(_fields) + ('_sortkey_cache', '_stored_cache')
 
     def __init__(self, *args, **kwargs):
-        '''setup a window instance dynamically from positional and keyword
+        '''setup a window instance from positional and keyword
            parameters while factoring in default values
         '''
-        for idx, key in enumerate(self._fields):
-            try:
-                val = args[idx]
-            except IndexError:
-                val = self._defaults[idx]
-            self.__dict__[key] = val
+        (self.winid, self.desktop, self.pid, self.x, self.y, self.w, self.h,
+         self.cls, self.host, self.title, self.shaded) = \
+            args + self._defaults[len(args):]
         # apply overrides from kwargs
-        self.__dict__.update(**kwargs)
+        for key, val in kwargs.items():
+            setattr(self, key, val)
+        self._invalidate()
 
     @classmethod
     def _fromstr(cls, line):
         '''create instance from string'''
         # we parse the output of wnctrl -lGpx here (10 columns, space separated)
         # the shaded attribute is not taken into account
-        return Win(*line.split(maxsplit = len(cls._fields) - 2))
+        args = line.split(maxsplit = len(cls._fields) - 2)
+        if len(args) != len(cls._fields) - 1:
+            # missing columns, e.g. an empty title
+            return cls(*args)
+        self = cls.__new__(cls)
+        (self.winid, self.desktop, self.pid, self.x, self.y, self.w, self.h,
+         self.cls, self.host, self.title) = args
+        self.shaded = 'N'
+        self._invalidate()
+        return self
 
     @classmethod
     def _fromfile(cls, line):
         '''create instance from file representation'''
         # on disk format (8 columns, ', ' separated) is missing a couple of fields
-        return Win(**dict(zip(cls._storefields,
-                              line.split(', ', maxsplit = len(cls._storefields)-1))))
+        args = line.split(', ', maxsplit = len(cls._storefields) - 1)
+        if len(args) != len(cls._storefields):
+            # missing columns
+            return cls(**dict(zip(cls._storefields, args)))
+        self = cls.__new__(cls)
+        (self.desktop, self.shaded, self.x, self.y, self.w, self.h,
+         self.cls, self.title) = args
+        self.winid, self.pid, self.host = '0', '0', ''
+        self._invalidate()
+        return self
 
     def _tofile(self):
         '''convert instance to file representation'''
         return ', '.join(self._stored_tuple())
 
     def _stored_tuple(self):
-        '''create a tuple from stored values of this instance'''
-        return tuple(getattr(self, f) for f in self._storefields)
+        '''return a tuple of stored values of this instance, computed once'''
+        if self._stored_cache is None:
+            self._stored_cache = tuple(getattr(self, f) for f in self._storefields)
+        return self._stored_cache
 
     def cmp_all(self, other):
         '''compare all stored attributes'''
@@ -277,13 +324,30 @@ class Win:
                 and self.h == other.h
         return False
 
+    def _invalidate(self):
+        '''drop cached values, call after modifying attributes'''
+        self._sortkey_cache = None
+        self._stored_cache = None
+
+    @property
+    def _sortkey(self):
+        '''natural sort key of title and class, computed once'''
+        if self._sortkey_cache is None:
+            self._sortkey_cache = (natural_sort_key(self.title),
+                                   natural_sort_key(self.cls))
+        return self._sortkey_cache
+
+    @property
+    def _key(self):
+        '''identity of a window, see __eq__'''
+        return (self.title, self.cls)
+
     @property
     def geostr(self):
         '''generate a geometry value including gravity'''
         return '0,%s,%s,%s,%s' % (self.x, self.y, self.w, self.h)
 
-    # thanks to functools.total_ordering, implementing two special methods
-    # are enough to be fully sortable
+    # WinList sorts with _sortkey, __lt__ is kept for direct comparisons
     def __eq__(self, other):
         '''we define two windows equal, if title and class match'''
         if other:
@@ -294,19 +358,17 @@ class Win:
     def __lt__(self, other):
         '''allow sorting in natural (human) sort order'''
         if other:
-            if self.title != other.title:
-                return natural_sort_key(self.title) < natural_sort_key(other.title)
-            if self.cls != other.cls:
-                return natural_sort_key(self.cls) < natural_sort_key(other.cls)
+            return self._sortkey < other._sortkey
         return False
 
     def __hash__(self):
         '''hash corresponding with the other sorting methods'''
-        return hash((self.title, self.cls))
+        return hash(self._key)
 
     def __repr__(self):
         '''runtime representation'''
-        return '%s(\n%s\n)' % (self.__class__.__name__, fdict(self.__dict__))
+        attrs = {key: getattr(self, key) for key in self._fields}
+        return '%s(\n%s\n)' % (self.__class__.__name__, fdict(attrs))
 
 
 class WinList:
@@ -319,6 +381,10 @@ class WinList:
         '''setup empty window list, and call fromstr or fromfile, if requested'''
         self._fn = None
         self._wl = []
+        # index by (title, class), see Win.__eq__
+        self._idx = {}
+        # _wl is kept in natural sort order, see _sort
+        self._sorted = True
         # KeyErrors are programming errors
         for key, val in kwargs.items():
             self.funcdisp[key](self, val)
@@ -326,77 +392,101 @@ class WinList:
     def fromstr(self, buf):
         '''load window list from string (output of wmctrl)'''
         if buf:
-            lnnr = 0
-            for line in buf.split('\n'):
-                lnnr += 1
-                if line:
-                    try:
-                        self._wl.append(Win._fromstr(line))
-                    except TypeError:
-                        log.exception('line %s malformed: %s',
-                                      lnnr, line)
+            # titles may contain exotic line breaks, hence no splitlines()
+            self.fromlines(buf.split('\n'))
+        return len(self._wl)
+
+    def fromlines(self, lines):
+        '''load window list from lines without line breaks (output of wmctrl)'''
+        append = self._append
+        fromstr = Win._fromstr
+        for lnnr, line in enumerate(lines, 1):
+            if line:
+                try:
+                    append(fromstr(line))
+                except TypeError:
+                    log.exception('line %s malformed: %s',
+                                  lnnr, line)
         return len(self._wl)
 
     def fromfile(self, fn):
         '''load window list from file'''
         self._fn = fn
-        lnnr = 0
         try:
             with open(fn, 'r', encoding = 'utf-8') as fd:
-                for line in fd:
-                    line = rstrip(line)
-                    lnnr += 1
-                    if line:
-                        try:
-                            self._wl.append(Win._fromfile(line))
-                        except TypeError:
-                            log.exception('line %s in file %s malformed: %s',
-                                          lnnr, fn, line)
+                buf = fd.read()
         except OSError:
             log.exception('failed to read %s:', fn)
             return 0
+        append = self._append
+        fromfile = Win._fromfile
+        for lnnr, line in enumerate(buf.split('\n'), 1):
+            line = line.rstrip(' \t\r\n')
+            if line:
+                try:
+                    append(fromfile(line))
+                except TypeError:
+                    log.exception('line %s in file %s malformed: %s',
+                                  lnnr, fn, line)
         return len(self._wl)
 
+    def _append(self, win):
+        '''append window to list and index, first one wins in the index'''
+        self._wl.append(win)
+        self._idx.setdefault(win._key, win)
+        self._sorted = False
+
+    def _sort(self):
+        '''sort the list, if windows were added since the last call'''
+        if not self._sorted:
+            self._wl.sort(key = operator.attrgetter('_sortkey'))
+            self._sorted = True
+
     # ctor kwargs dispatcher
     funcdisp = {
         'fromstr': fromstr,
+        'fromlines': fromlines,
         'fromfile': fromfile,
     }
 
     def tofile(self, fn):
         '''save window list to file'''
         self._fn = fn
-        lnnr = 0
         if self._wl:
+            # assemble the content upfront and write it at once
+            self._sort()
+            buf = ''.join(win._tofile() + '\n' for win in self._wl)
             try:
-                with open(fn, 'w', encoding = 'utf-8') as fd:
-                    for win in sorted(self._wl):
-                        lnnr += 1
-                        line = win._tofile()
-                        fd.write(line + '\n')
+                with open(fn, 'w', encoding = 'utf-8', newline = '\n') as fd:
+                    fd.write(buf)
             except OSError:
-                log.exception('failed to write %s:', fd)
+                log.exception('failed to write %s:', fn)
                 return 0
         return len(self._wl)
 
+    def digest(self):
+        '''order independent digest of the stored window attributes'''
+        buf = '\n'.join(sorted(win._tofile() for win in self._wl))
+        return hashlib.sha1(buf.encode('utf-8', 'surrogateescape')).hexdigest()
+
     def match(self, win):
         '''match a window in the list'''
-        try:
-            cur = self._wl[self._wl.index(win)]
-        except (IndexError, ValueError):
-            cur = None
-        else:
+        cur = self._idx.get(win._key)
+        if cur is not None:
             log.debug('match other win:\n%r\nwith current:\n%r', win, cur)
         return cur
 
     def __eq__(self, other):
         '''compare for equality of both window lists'''
         if other:
-            for win in self._wl:
-                if not win.cmp_all(other.match(win)):
-                    return False
-            for oth in other._wl:
-                if not oth.cmp_all(self.match(oth)):
+            # cheap checks first: size, then the set of windows
+            if len(self._idx) != len(other._idx):
+                return False
+            if self._idx.keys() != other._idx.keys():
+                return False
+            othidx = other._idx
+            for key, win in self._idx.items():
+                if not win.cmp_all(othidx[key]):
                     return False
             # all windows in both lists are identical
             return True
@@ -404,23 +494,32 @@ class WinList:
 
     def __iadd__(self, win):
         '''add window to list with +='''
-        if win in self._wl:
+        if win._key in self._idx:
             raise WinDuplicate(win)
-        self._wl.append(win)
+        self._append(win)
         return self
 
     def __isub__(self, win):
         '''remove window from list with -='''
         try:
-            del self._wl[self._wl.index(win)]
-        except IndexError:
+            cur = self._idx.pop(win._key)
+        except KeyError:
             raise WinNotFound(win)
+        self._wl.remove(cur)
         return self
 
+    def __contains__(self, win):
+        '''window in list'''
+        return win._key in self._idx
+
     def __iter__(self):
-        '''iterate over all windows'''
-        for win in sorted(self._wl):
-            yield win
+        '''iterate over all windows in list order'''
+        return iter(self._wl)
+
+    def sorted(self):
+        '''iterate over all windows in sort order'''
+        self._sort()
+        return iter(self._wl)
 
     def __len__(self):
         '''list length'''
@@ -431,17 +530,20 @@ class WinList:
         return bool(self._wl)
 
 
-def command(cmd, *args):
-    '''run command, check result and collect stdout/stderr output'''
-    cmd = [cmd]
-    cmd.extend(args)
+def command(cmd, *args, output = True):
+    '''run command, check result and collect stdout/stderr output,
+       stdout is discarded, if output is False
+    '''
+    cmd = [cmd, *args]
     log.debug('run: %s', ' '.join(cmd))
     # in order to handle encoding errors correctly,
     # we convert with surrogateescape manually
+    # (this also preserves carriage returns in window titles)
     try:
         res = subprocess.run(cmd,
                              check = True,
-                             capture_output = True)
+                             stdout = output and subprocess.PIPE or subprocess.DEVNULL,
+                             stderr = subprocess.PIPE)
     except subprocess.CalledProcessError as e:
         log.debug('error: command returned %s:\n%s',
                   e.returncode, seutf8(e.stderr))
@@ -453,6 +555,32 @@ def command(cmd, *args):
         return res.returncode, res.stdout
 
 
+def command_lines(cmd, *args):
+    '''run command, yield stdout line by line, while the command is running,
+       raise subprocess.CalledProcessError on failure
+    '''
+    cmd = [cmd, *args]
+    log.debug('run: %s', ' '.join(cmd))
+    # collect stderr in a file, a pipe read after stdout might block the child
+    with tempfile.TemporaryFile() as errfd:
+        with subprocess.Popen(cmd,
+                              stdout = subprocess.PIPE,
+                              stderr = errfd) as proc:
+            # split lines on line feeds only, titles may contain carriage returns
+            for line in io.TextIOWrapper(proc.stdout,
+                                         encoding = 'utf-8',
+                                         errors = 'surrogateescape',
+                                         newline = '\n'):
+                if line.endswith('\n'):
+                    line = line[:-1]
+                yield line
+            rc = proc.wait()
+        if rc:
+            errfd.seek(0)
+            errmsg = errfd.read().decode('utf-8', 'surrogateescape')
+            raise subprocess.CalledProcessError(rc, cmd, stderr = errmsg)
+
+
 def test_command(cmd, *args):
     cmdstr = '%s %s' % (cmd, ' '.join(args))
     try:
@@ -464,76 +592,253 @@ def test_command(cmd, *args):
         return rc, '%s: failed with error: %s' % (cmdstr, buf)
 
 
+@functools.lru_cache(maxsize = 32)
+def xprop_re(prop):
+    '''compiled pattern to extract the value of prop from xprop output'''
+    return re.compile(r'%s\(.*\) = (.*)' % re.escape(prop))
+
+
 def xprop(winid, prop):
     '''run xprop for winid, return value of property'''
-    rc, res = command('xprop', '-id', winid)
+    # query the single property only, a full dump includes icon data, etc.
+    rc, res = command('xprop', '-id', winid, prop)
     if rc == 0 and res:
-        for line in res.split('\n'):
-            if not line:
-                continue
-            m = re.match('%s\(.*\) = (.*)' % prop, line)
+        match = xprop_re(prop).match
+        for line in res.splitlines():
+            m = match(line)
             if m:
                 return m.group(1)
 
 
-def wmctrl_move_to_desktop(winid, desktop):
-    '''run wmctrl -ir winid -t desktop'''
-    return command('wmctrl', '-ir', winid, '-t', desktop)[0]
-
+class Wmctrl:
+    '''window adjustments with wmctrl
+       - collects the commands per window
+       - runs them from a single shell on flush, windows are processed
+         concurrently, commands of a window in order
+    '''
+    def __init__(self):
+        self._cmds = {}
 
-def wmctrl_adjust_geometry(winid, geostr):
-    '''run wmctrl -ir winid -e geostr'''
-    return command('wmctrl', '-ir', winid, '-e', geostr)[0]
+    def _add(self, winid, *args):
+        self._cmds.setdefault(winid, []).append(('wmctrl', '-ir', winid) + args)
 
+    def move_to_desktop(self, winid, desktop):
+        '''wmctrl -ir winid -t desktop'''
+        self._add(winid, '-t', desktop)
 
-def wmctrl_toggle_shaded(winid):
-    '''run wmctrl -ir winid -b toggle,shaded'''
-    return command('wmctrl', '-ir', winid, '-b', 'toggle,shaded')[0]
+    def adjust_geometry(self, winid, geostr):
+        '''wmctrl -ir winid -e geostr'''
+        self._add(winid, '-e', geostr)
 
+    def toggle_shaded(self, winid):
+        '''wmctrl -ir winid -b toggle,shaded'''
+        self._add(winid, '-b', 'toggle,shaded')
 
-def fetch_winlist():
-    '''run wmctrl -lGpx, filter selected, return WinList'''
+    def flush(self):
+        '''run collected commands'''
+        if not self._cmds:
+            return 0
+        script = []
+        for idx, cmds in enumerate(self._cmds.values(), 1):
+            script.append('(%s) &' % '; '.join(' '.join(map(shlex.quote, cmd))
+                                                for cmd in cmds))
+            # limit the number of concurrent processes
+            if idx % gpar.maxworkers == 0:
+                script.append('wait')
+        script.append('wait')
+        self._cmds = {}
+        return command('sh', '-c', '\n'.join(script), output = False)[0]
+
+
+class X11:
+    '''window adjustments and queries with EWMH requests via python-xlib
+       - same interface as Wmctrl, requests are sent on flush
+       - replaces xprop for the shaded state
+    '''
+    def __init__(self):
+        self.display = Xlib.display.Display()
+        self.root = self.display.screen().root
+        self._atoms = {}
+        # EWMH requests supported by the window manager
+        prop = self.root.get_full_property(self._atom('_NET_SUPPORTED'),
+                                           Xlib.Xatom.ATOM)
+        self._supported = prop and set(prop.value) or set()
+
+    def _atom(self, name):
+        '''interned atom, cached'''
+        try:
+            return self._atoms[name]
+        except KeyError:
+            atom = self._atoms[name] = self.display.intern_atom(name)
+            return atom
+
+    def _window(self, winid):
+        '''window object from hex winid string'''
+        return self.display.create_resource_object('window', int(winid, 16))
+
+    def _client_message(self, winid, msgtype, *data):
+        '''send EWMH client message, data are up to 5 (unsigned) longs'''
+        data = [val & 0xffffffff for val in data]
+        data.extend([0] * (5 - len(data)))
+        ev = Xlib.protocol.event.ClientMessage(
+            window = self._window(winid),
+            client_type = self._atom(msgtype),
+            data = (32, data),
+        )
+        # to the root window, see wmctrl's client_msg()
+        self.root.send_event(ev, event_mask = Xlib.X.SubstructureRedirectMask
+                                            | Xlib.X.SubstructureNotifyMask)
+
+    def shaded(self, winids):
+        '''window states are shaded (only), see xprop usage in filter_winlist'''
+        state = self._atom('_NET_WM_STATE')
+        shaded = [self._atom('_NET_WM_STATE_SHADED')]
+        # send all requests upfront, and collect the replies afterwards:
+        # this costs a single round trip, compared to one per window
+        reqs = [Xlib.protocol.request.GetProperty(
+                    display = self.display.display,
+                    defer = True,
+                    delete = False,
+                    window = int(winid, 16),
+                    property = state,
+                    type = Xlib.X.AnyPropertyType,
+                    long_offset = 0,
+                    long_length = 32)
+                for winid in winids]
+        ret = []
+        for winid, req in zip(winids, reqs):
+            try:
+                req.reply()
+            except Xlib.error.XError:
+                log.debug('failed to fetch state of %s', winid)
+                ret.append(False)
+            else:
+                ret.append(bool(req.property_type) and list(req.value[1]) == shaded)
+        return ret
+
+    def move_to_desktop(self, winid, desktop):
+        '''_NET_WM_DESKTOP desktop'''
+        self._client_message(winid, '_NET_WM_DESKTOP', int(desktop))
+
+    def adjust_geometry(self, winid, geostr):
+        '''_NET_MOVERESIZE_WINDOW gravity,x,y,w,h'''
+        grav, x, y, w, h = (int(val) for val in geostr.split(','))
+        if self._atom('_NET_MOVERESIZE_WINDOW') not in self._supported:
+            # like wmctrl, configure the window directly, -1 is left unchanged
+            geo = dict(x = x, y = y, width = w, height = h)
+            geo = {key: val for key, val in geo.items() if val != -1}
+            if geo:
+                self._window(winid).configure(**geo)
+            return
+        # like wmctrl, x, y, w, h are present unless -1
+        flags = grav
+        for bit, val in ((0x100, x), (0x200, y), (0x400, w), (0x800, h)):
+            if val != -1:
+                flags |= bit
+        self._client_message(winid, '_NET_MOVERESIZE_WINDOW', flags, x, y, w, h)
+
+    def toggle_shaded(self, winid):
+        '''_NET_WM_STATE toggle _NET_WM_STATE_SHADED'''
+        self._client_message(winid, '_NET_WM_STATE', 2,
+                             self._atom('_NET_WM_STATE_SHADED'))
+
+    def flush(self):
+        '''send pending requests'''
+        self.display.flush()
+        return 0
+
+
+def fetch_winlist(shaded = True):
+    '''run wmctrl -lGpx, filter selected, return WinList,
+       the shaded state is only fetched, if requested
+    '''
     log.info('fetch window list')
     curlist = WinList()
-    rc, buf = command('wmctrl', '-lGpx')
-    if rc == 0:
-        # load from buffer
-        if curlist.fromstr(buf):
-            # and filter list
-            curlist = filter_winlist(curlist)
+    try:
+        # parse while wmctrl is producing output
+        curlist.fromlines(command_lines('wmctrl', '-lGpx'))
+    except subprocess.CalledProcessError as e:
+        log.debug('error: command returned %s:\n%s',
+                  e.returncode, e.stderr)
+        return WinList()
+    if curlist:
+        # and filter list
+        curlist = filter_winlist(curlist, shaded)
     return curlist
 
 
-def filter_winlist(srclist):
-    '''filter/qualify list of windows according supplied options'''
+# bracket part of a window title
+_BRACKET_RE = re.compile(r'\[.*?\]')
+
+
+def fetch_shaded(wins):
+    '''return the shaded state of windows'''
+    if gpar.x11:
+        return gpar.x11.shaded([win.winid for win in wins])
+    # xprop calls are independent, run them concurrently
+    shaded = lambda win: xprop(win.winid, '_NET_WM_STATE') == '_NET_WM_STATE_SHADED'
+    with concurrent.futures.ThreadPoolExecutor(gpar.maxworkers) as executor:
+        return list(executor.map(shaded, wins))
+
+
+def update_shaded(wins):
+    '''update shaded state of windows'''
+    for win, shaded in zip(wins, fetch_shaded(wins)):
+        if shaded:
+            win.shaded = 'S'
+        else:
+            win.shaded = 'N'
+        win._invalidate()
+
+
+def filter_winlist(srclist, shaded = True):
+    '''filter/qualify list of windows according supplied options,
+       the shaded state is only fetched, if requested
+    '''
     dstlist = WinList()
 
-    def match(patlist, win):
+    def compile_patterns(patlist):
+        '''compile patterns into a single match method, None without patterns'''
+        regexps = []
         for pat in patlist:
-            if gpar.regexp:
-                try:
-                    if re.match(pat, win):
-                        return True
-                except re.error:
-                    exit(2, 'error in regexp: <%s>' % pat)
-            elif fnmatch.fnmatch(win, pat):
-                return True
-        return False
+            try:
+                if gpar.regexp:
+                    regexps.append(re.compile(pat))
+                else:
+                    regexps.append(re.compile(fnmatch.translate(pat)))
+            except re.error:
+                exit(2, 'error in regexp: <%s>' % pat)
+        if not regexps:
+            return None
+        if len(regexps) == 1:
+            return regexps[0].match
+        # combine into one alternation, unless group references could break,
+        # or inline flags would apply to all patterns (before Python 3.11)
+        deflags = re.compile('').flags
+        if not any(regexp.groups or regexp.flags != deflags for regexp in regexps):
+            return re.compile('|'.join('(?:%s)' % regexp.pattern
+                                       for regexp in regexps)).match
+        matchers = [regexp.match for regexp in regexps]
+        return lambda s: any(match(s) for match in matchers)
+
+    classes = compile_patterns(gpar.classes)
+    titles = compile_patterns(gpar.titles)
 
     try:
         for win in srclist:
             if gpar.bracket:
-                m = re.match('\[.*?\]', win.title)
+                m = _BRACKET_RE.match(win.title)
                 if m:
                     win.title = m.group(0)
+                    win._invalidate()
                     dstlist += win
                 continue
-            elif gpar.classes:
-                if match(gpar.classes, win.cls):
+            elif classes:
+                if classes(win.cls):
                     dstlist += win
                     continue
-            elif gpar.titles:
-                if match(gpar.titles, win.title):
+            elif titles:
+                if titles(win.title):
                     dstlist += win
                     continue
             else:
@@ -542,29 +847,65 @@ def filter_winlist(srclist):
     except WinDuplicate as e:
         log.error('duplicate window ignored:\n%s', e.win)
 
-    # update shaded state
-    for win in dstlist:
-        if xprop(win.winid, '_NET_WM_STATE') == '_NET_WM_STATE_SHADED':
-            win.shaded = 'S'
-        else:
-            win.shaded = 'N'
+    if shaded:
+        update_shaded(list(dstlist))
 
     log.info('%s windows passed filter (from %s)', len(dstlist), len(srclist))
     return dstlist
 
 
-def store_filelist(maxcnt = None):
-    '''fetch list of saved window lists, optional limit # of items'''
+@functools.lru_cache(maxsize = None)
+def scan_storelist():
+    '''collect saved window lists, cached for the process lifetime'''
     log.info('collect store list from %s', unexpanduser(gpar.storelistdir))
-    storelist = []
-    for fn in os.listdir(gpar.storelistdir):
-        if fnmatch.fnmatch(fn, '*.wmlst'):
-            storelist.append(fn)
+    with os.scandir(gpar.storelistdir) as it:
+        return tuple(entry.name for entry in it if entry.name.endswith('.wmlst'))
+
+
+def store_filelist(maxcnt = None):
+    '''fetch sorted list of saved window lists, optional limit # of items'''
+    # timestamp filenames sort lexically
+    storelist = scan_storelist()
+    if maxcnt and 0 < maxcnt < len(storelist) // 2:
+        # e.g. the latest one only
+        return sorted(heapq.nlargest(maxcnt, storelist))
     if not maxcnt:
         maxcnt = len(storelist)
     return sorted(storelist)[-maxcnt:]
 
 
+def read_meta(fn):
+    '''read the meta data of a saved window list, None if unavailable
+       or out of date with the saved window list
+    '''
+    try:
+        with open(fn + '.meta', 'r', encoding = 'utf-8') as fd:
+            meta = json.load(fd)
+        st = os.stat(fn)
+    except (OSError, ValueError):
+        meta = None
+    if not isinstance(meta, dict) or not ('count' in meta and 'digest' in meta):
+        log.debug('no valid meta data for %s', fn)
+        return None
+    # the window list might have been edited, replaced or restored
+    if meta.get('size') != st.st_size or meta.get('mtime') != st.st_mtime_ns:
+        log.debug('stale meta data for %s', fn)
+        return None
+    return meta
+
+
+def write_meta(fn, winlist):
+    '''write item count and digest of a saved window list'''
+    try:
+        st = os.stat(fn)
+        meta = dict(count = len(winlist), digest = winlist.digest(),
+                    size = st.st_size, mtime = st.st_mtime_ns)
+        with open(fn + '.meta', 'w', encoding = 'utf-8') as fd:
+            json.dump(meta, fd)
+    except OSError:
+        log.exception('failed to write %s.meta:', fn)
+
+
 def store(args):
     '''store geometry of selected windows'''
     curlist = fetch_winlist()
@@ -577,19 +918,31 @@ def store(args):
     except IndexError:
         pass
     else:
-        stolist = WinList(fromfile = os.path.join(gpar.storelistdir, wmlstfn))
-        if curlist == stolist:
+        stofn = os.path.join(gpar.storelistdir, wmlstfn)
+        meta = read_meta(stofn)
+        # a digest mismatch saves parsing the stored list
+        if meta and meta['digest'] != curlist.digest():
+            unchanged = False
+        else:
+            unchanged = curlist == WinList(fromfile = stofn)
+        if unchanged:
             msg = gpar.force and '' or ': not saved'
             log.info("%s hasn't changed%s", wmlstfn, msg)
             if not gpar.force:
                 return 0
 
     if curlist:
-        for win in curlist:
-            log.debug(repr(win))
+        if log.isEnabledFor(logging.DEBUG):
+            for win in curlist.sorted():
+                log.debug('%r', win)
         # save window list
         fn = new_timestamp_filename(gpar.storelistdir, '.wmlst')
-        curlist.tofile(fn)
+        if curlist.tofile(fn):
+            write_meta(fn, curlist)
+            scan_storelist.cache_clear()
+        else:
+            # drop the reserved, empty file
+            os.remove(fn)
         log.info('%s stored [%s matches]', unexpanduser(fn), len(curlist))
     else:
         log.warning('no match')
@@ -639,26 +992,34 @@ def restore(args):
 
     # session to restore located, apply it
     log.info('restore %s', wmlstfn)
-    curlist = fetch_winlist()
+    # the shaded state is only needed for windows of the session
+    curlist = fetch_winlist(shaded = False)
     # load saved list, compare with current state, and adjust accordingly
     stolist = WinList(fromfile = os.path.join(gpar.storelistdir, wmlstfn))
+    matches = []
     for sto in stolist:
         cur = curlist.match(sto)
         if cur:
-            log.debug('stored:\n%s', sto)
-            log.debug('current:\n%s', cur)
-            if not cur.cmp_desktop(sto):
-                log.info('move <%s> from desktop %s to desktop %s',
-                         cur.title, cur.desktop, sto.desktop)
-                wmctrl_move_to_desktop(cur.winid, sto.desktop)
-            if not cur.cmp_geometry(sto):
-                log.info('adjust geometry of <%s> from %s to %s',
-                         cur.title, cur.geostr, sto.geostr)
-                wmctrl_adjust_geometry(cur.winid, sto.geostr)
-            if not cur.cmp_shaded(sto):
-                log.info('adjust shaded state of <%s> from %s to %s',
-                         cur.title, cur.shaded, sto.shaded)
-                wmctrl_toggle_shaded(cur.winid)
+            matches.append((sto, cur))
+    update_shaded([cur for sto, cur in matches])
+    # collect all adjustments and apply them at once
+    wm = gpar.x11 or Wmctrl()
+    for sto, cur in matches:
+        log.debug('stored:\n%s', sto)
+        log.debug('current:\n%s', cur)
+        if not cur.cmp_desktop(sto):
+            log.info('move <%s> from desktop %s to desktop %s',
+                     cur.title, cur.desktop, sto.desktop)
+            wm.move_to_desktop(cur.winid, sto.desktop)
+        if not cur.cmp_geometry(sto):
+            log.info('adjust geometry of <%s> from %s to %s',
+                     cur.title, cur.geostr, sto.geostr)
+            wm.adjust_geometry(cur.winid, sto.geostr)
+        if not cur.cmp_shaded(sto):
+            log.info('adjust shaded state of <%s> from %s to %s',
+                     cur.title, cur.shaded, sto.shaded)
+            wm.toggle_shaded(cur.winid)
+    wm.flush()
     return 0
 
 
@@ -666,8 +1027,9 @@ def curlist(args):
     '''list selected windows'''
     curlist = fetch_winlist()
     if curlist:
-        for cur in curlist:
-            log.debug(repr(cur))
+        if log.isEnabledFor(logging.DEBUG):
+            for cur in curlist.sorted():
+                log.debug('%r', cur)
         curlist.tofile(1)
     else:
         exit(3, 'no match')
@@ -688,8 +1050,13 @@ def liststore(args):
 
     for fn in store_filelist(maxcnt):
         if gpar.loglevel <= logging.INFO:
-            stolist = WinList(fromfile = os.path.join(gpar.storelistdir, fn))
-            stdout('%s [%s items]' % (fn, len(stolist)))
+            stofn = os.path.join(gpar.storelistdir, fn)
+            meta = read_meta(stofn)
+            if meta:
+                count = meta['count']
+            else:
+                count = len(WinList(fromfile = stofn))
+            stdout('%s [%s items]' % (fn, count))
         else:
             stdout(fn)
     return 0
@@ -737,7 +1104,17 @@ def main():
 
     setup_logging(gpar.loglevel)
 
-    for cmd in (('wmctrl', '-h'), ('xprop', '-version')):
+    # list doesn't deal with windows, hence needs no display
+    if Xlib and args and args[0].lower() != 'list':
+        try:
+            gpar.x11 = X11()
+        except Xlib.error.DisplayError as e:
+            log.debug('X11 connection failed: %s', e)
+
+    cmds = [('wmctrl', '-h')]
+    if not gpar.x11:
+        cmds.append(('xprop', '-version'))
+    for cmd in cmds:
         rc, msg = test_command(*cmd)
         if rc:
             exit(2, msg)